@@ -0,0 +1,298 @@
+"""
+Offline batch mode: biorhythm and Pythagoras square compatibility for CSV/JSONL exports.
+
+    python batch.py pairs.csv result.jsonl --workers 4
+
+Input rows need two birthdate columns (ДД.ММ.ГГГГ or ГГГГ-ММ-ДД); all other
+columns, like ids, are copied to the output. The file is read and written chunk
+by chunk, so memory does not grow with its size.
+"""
+import argparse
+import collections
+import csv
+import datetime
+import io
+import itertools
+import json
+import re
+import sys
+import time
+
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from biorithmic_tree import compatibility_batch
+from compute import warm_up
+from pythogoras_square import get_sector_vectors, square_compatibility_batch
+
+
+CHUNK_SIZE = 50_000
+REPORT_INTERVAL = 5.0
+FIRST_COLUMN = "first_birthdate"
+SECOND_COLUMN = "second_birthdate"
+DOTTED_DATE = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})")
+ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+
+
+def to_iso(value: str) -> str:
+    """Normalizes ДД.ММ.ГГГГ and ГГГГ-ММ-ДД to ISO; anything else, like a 2-digit year, becomes NaT."""
+    value = value.strip()
+    match = DOTTED_DATE.fullmatch(value)
+    if match:
+        day, month, year = match.groups()
+    else:
+        match = ISO_DATE.fullmatch(value)
+        if not match:
+            return "NaT"
+        year, month, day = match.groups()
+    return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+
+def parse_dates(values: list[str]) -> np.ndarray:
+    """Converts birthdates to datetime64[D]; unparsable ones become NaT."""
+    try:
+        return np.array([to_iso(value) for value in values], dtype="datetime64[D]")
+    except ValueError:
+        dates = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[D]")
+        for i, value in enumerate(values):
+            try:
+                dates[i] = np.datetime64(to_iso(value), "D")
+            except ValueError:
+                pass
+        return dates
+
+
+@dataclass
+class ReadStats:
+    malformed: int = 0
+
+
+@dataclass
+class Columns:
+    """Birthdate columns and the input columns passed through to the output."""
+    first: str
+    second: str
+    extra: list[str]
+    header: list[str]
+
+
+def format_vector(vector: np.ndarray) -> str:
+    return " ".join(str(value) for value in vector)
+
+
+def process_chunk(
+    first_values: list[str],
+    second_values: list[str],
+    extra_values: list[list],
+    columns: Columns,
+    as_of: datetime.date,
+    with_squares: bool = False,
+) -> list[dict]:
+    first_dates = parse_dates(first_values)
+    second_dates = parse_dates(second_values)
+    valid = ~(np.isnat(first_dates) | np.isnat(second_dates))
+    valid &= (first_dates <= np.datetime64(as_of)) & (second_dates <= np.datetime64(as_of))
+    first_dates, second_dates = first_dates[valid], second_dates[valid]
+
+    biorhythm = compatibility_batch(first_dates, second_dates, as_of).tolist()
+    first_vectors = get_sector_vectors(first_dates)
+    second_vectors = get_sector_vectors(second_dates)
+    square = square_compatibility_batch(first_vectors, second_vectors).tolist()
+
+    rows = []
+    position = 0
+    for first, second, extras, is_valid in zip(first_values, second_values, extra_values, valid.tolist()):
+        # Остальные колонки входа (id и т.п.) переносим как есть, чтобы результат можно было сджойнить
+        row = dict(zip(columns.extra, extras))
+        row.update({columns.first: first, columns.second: second, "biorhythm": None, "square": None})
+        if with_squares:
+            row["first_square"] = row["second_square"] = None
+        if is_valid:
+            row["biorhythm"] = biorhythm[position]
+            row["square"] = square[position]
+            if with_squares:
+                row["first_square"] = format_vector(first_vectors[position])
+                row["second_square"] = format_vector(second_vectors[position])
+            position += 1
+        rows.append(row)
+    return rows
+
+
+def get_format(path: str, default: str) -> str:
+    if path.endswith(".jsonl") or path.endswith(".json"):
+        return "jsonl"
+    if path.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def read_header(file, file_format: str) -> tuple[list[str], Iterator]:
+    """
+    Returns the input column names and an iterator over the raw rows. For JSONL
+    the columns are the keys of the first record, which is put back in front.
+    """
+    if file_format == "csv":
+        reader = csv.reader(file)
+        return next(reader, []), reader
+
+    lines = (line for line in file if line.strip())
+    first_line = next(lines, None)
+    if first_line is None:
+        return [], lines
+    try:
+        record = json.loads(first_line)
+    except json.JSONDecodeError:
+        record = None
+    header = list(record) if isinstance(record, dict) else []
+    return header, itertools.chain([first_line], lines)
+
+
+def get_csv_values(row: list[str], indexes: list[int], stats: ReadStats) -> tuple[str, str, list]:
+    first_index, second_index, *extra_indexes = indexes
+    extras = [row[i] if i < len(row) else "" for i in extra_indexes]
+    if len(row) <= max(first_index, second_index):
+        stats.malformed += 1
+        return "", "", extras
+    return row[first_index], row[second_index], extras
+
+
+def get_json_values(line: str, columns: Columns, stats: ReadStats) -> tuple[str, str, list]:
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        record = None
+    if not isinstance(record, dict):
+        stats.malformed += 1
+        return "", "", [None] * len(columns.extra)
+    return (
+        str(record.get(columns.first) or ""),
+        str(record.get(columns.second) or ""),
+        [record.get(column) for column in columns.extra],
+    )
+
+
+def read_chunks(rows: Iterator, file_format: str, columns: Columns, chunk_size: int, stats: ReadStats):
+    """
+    Yields (first_values, second_values, extra_values) chunks. Malformed rows come
+    through as empty values, so they get null results in place instead of stopping the run.
+    """
+    if file_format == "csv":
+        indexes = [columns.header.index(column) for column in (columns.first, columns.second, *columns.extra)]
+        values = (get_csv_values(row, indexes, stats) for row in rows if row)
+    else:
+        values = (get_json_values(line, columns, stats) for line in rows)
+
+    while True:
+        chunk = list(itertools.islice(values, chunk_size))
+        if not chunk:
+            return
+        first_values, second_values, extra_values = zip(*chunk)
+        yield list(first_values), list(second_values), list(extra_values)
+
+
+def get_fieldnames(columns: Columns, with_squares: bool) -> list[str]:
+    fieldnames = [*columns.extra, columns.first, columns.second, "biorhythm", "square"]
+    if with_squares:
+        fieldnames += ["first_square", "second_square"]
+    return fieldnames
+
+
+def format_rows(rows: list[dict], file_format: str, columns: Columns, with_squares: bool) -> str:
+    if file_format == "jsonl":
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, fieldnames=get_fieldnames(columns, with_squares)).writerows(rows)
+    return buffer.getvalue()
+
+
+def render_chunk(
+    first_values: list[str],
+    second_values: list[str],
+    extra_values: list[list],
+    columns: Columns,
+    as_of: datetime.date,
+    with_squares: bool,
+    file_format: str,
+) -> tuple[int, str]:
+    """Processes a chunk and returns it already formatted, so workers send back one string."""
+    rows = process_chunk(first_values, second_values, extra_values, columns, as_of, with_squares)
+    return len(rows), format_rows(rows, file_format, columns, with_squares)
+
+
+def run_chunks(chunks, workers: int, *args):
+    """Yields rendered chunks in input order, keeping at most 2 * workers in flight."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield render_chunk(*chunk, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as executor:
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(render_chunk, *chunk, *args))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def open_file(path: str, mode: str):
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Batch compatibility calculation for birthdate pairs.")
+    parser.add_argument("input", help="CSV or JSONL file with birthdate pairs, '-' for stdin")
+    parser.add_argument("output", help="CSV or JSONL file for results, '-' for stdout")
+    parser.add_argument("--input-format", choices=("csv", "jsonl"))
+    parser.add_argument("--output-format", choices=("csv", "jsonl"))
+    parser.add_argument("--first-column", default=FIRST_COLUMN)
+    parser.add_argument("--second-column", default=SECOND_COLUMN)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="processes for chunk calculation")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="date biorhythms are calculated for, ГГГГ-ММ-ДД")
+    parser.add_argument("--squares", action="store_true", help="also output both Pythagoras squares")
+    args = parser.parse_args(argv)
+
+    input_format = args.input_format or get_format(args.input, "csv")
+    output_format = args.output_format or get_format(args.output, "jsonl")
+
+    started = last_report = time.monotonic()
+    total = 0
+    read_stats = ReadStats()
+    with open_file(args.input, "r") as input_file:
+        header, rows = read_header(input_file, input_format)
+        # Проверяем до открытия выхода, чтобы не затереть его из-за опечатки в имени колонки
+        missing = [column for column in (args.first_column, args.second_column) if column not in header]
+        if input_format == "csv" and missing:
+            parser.error(f"columns not found in CSV header: {', '.join(missing)}")
+        extra = [column for column in header if column not in (args.first_column, args.second_column)]
+        columns = Columns(args.first_column, args.second_column, extra, header)
+        with open_file(args.output, "w") as output_file:
+            chunks = read_chunks(rows, input_format, columns, args.chunk_size, read_stats)
+            if output_format == "csv":
+                csv.DictWriter(output_file, fieldnames=get_fieldnames(columns, args.squares)).writeheader()
+            for count, text in run_chunks(chunks, args.workers, columns, args.as_of, args.squares, output_format):
+                output_file.write(text)
+                total += count
+                now = time.monotonic()
+                if now - last_report >= REPORT_INTERVAL:
+                    print(f"{total} rows, {total / (now - started):.0f} rows/s", file=sys.stderr)
+                    last_report = now
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Done: {total} rows in {elapsed:.1f}s, {total / max(elapsed, 1e-9):.0f} rows/s, "
+        f"{read_stats.malformed} malformed",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
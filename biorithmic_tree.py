@@ -1,6 +1,9 @@
 import datetime
+import functools
 from dataclasses import dataclass
 
+import numpy as np
+
 
 PHYSICAL_CONST = 23.6884
 EMOTIONAL_CONST = 28.426125
@@ -10,17 +13,25 @@ CREATIVE_CONST = 42.6392
 INTUITIVE_CONST = 47.3769
 HIGHER_CONST = 52.1146
 
+PERIODS = (PHYSICAL_CONST, EMOTIONAL_CONST, INTELLIGENT_CONST, HEART_CONST, CREATIVE_CONST, INTUITIVE_CONST, HIGHER_CONST)
+
+SEARCH_START = datetime.date(1950, 1, 1)
+SEARCH_END = datetime.date(2010, 12, 31)
+
 
 @dataclass
 class BiorhythmCompatibility:
     first_birthdate: datetime.date
     second_birthdate: datetime.date
+    as_of: datetime.date | None = None
 
     def calculate_biorhythm(self, birthdate, period):
-        days_since_birth = (datetime.date.today() - birthdate).days
+        days_since_birth = (self.as_of - birthdate).days
         return days_since_birth % period
 
     def __post_init__(self) -> None:
+        if self.as_of is None:
+            self.as_of = datetime.date.today()
         self.first_physical = self.calculate_biorhythm(self.first_birthdate, PHYSICAL_CONST)
         self.first_emotional = self.calculate_biorhythm(self.first_birthdate, EMOTIONAL_CONST)
         self.first_intelligent = self.calculate_biorhythm(self.first_birthdate, INTELLIGENT_CONST)
@@ -55,3 +66,57 @@ class BiorhythmCompatibility:
         max_possible_difference = 7 * max(PHYSICAL_CONST, EMOTIONAL_CONST, INTELLIGENT_CONST, HEART_CONST, CREATIVE_CONST, INTUITIVE_CONST, HIGHER_CONST)
         compatibility = 100 - int((total_difference / max_possible_difference) * 100)
         return max(0, min(100, compatibility)) # calc biorithms
+
+
+def compatibility_batch(first_birthdates, second_birthdates, as_of: datetime.date) -> np.ndarray:
+    """
+    Vectorized BiorhythmCompatibility for arrays of datetime64[D] pairs, giving
+    the same integers as calculate_compatibility(). Either side may be a single date.
+    """
+    today = np.datetime64(as_of, "D")
+    first_days = (today - np.asarray(first_birthdates, dtype="datetime64[D]")).astype(np.int64)
+    second_days = (today - np.asarray(second_birthdates, dtype="datetime64[D]")).astype(np.int64)
+
+    # Складываем по одному ритму, в том же порядке, что и calculate_compatibility()
+    total_difference = np.zeros(np.broadcast(first_days, second_days).shape)
+    for period in PERIODS:
+        total_difference += np.abs(first_days % period - second_days % period)
+
+    max_possible_difference = 7 * max(PERIODS)
+    compatibility = 100 - ((total_difference / max_possible_difference) * 100).astype(np.int64)
+    return np.clip(compatibility, 0, 100)
+
+
+def compatibility_scores(birthdate: datetime.date, candidates: np.ndarray, as_of: datetime.date) -> np.ndarray:
+    """Scores one birthdate against an array of datetime64[D] candidates."""
+    return compatibility_batch(birthdate, candidates, as_of)
+
+
+def top_compatible_birthdates(
+    birthdate: datetime.date,
+    k: int = 10,
+    start: datetime.date = SEARCH_START,
+    end: datetime.date = SEARCH_END,
+    as_of: datetime.date | None = None,
+) -> list[tuple[datetime.date, int]]:
+    """Returns the k other birthdates in [start, end] most compatible with birthdate, best first."""
+    return list(_top_compatible_birthdates(birthdate, k, start, end, as_of or datetime.date.today()))
+
+
+@functools.lru_cache(maxsize=1024)
+def _top_compatible_birthdates(birthdate, k, start, end, as_of) -> tuple[tuple[datetime.date, int], ...]:
+    end = min(end, as_of)
+    if k <= 0 or start > end:
+        return ()
+    candidates = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    candidates = candidates[candidates != np.datetime64(birthdate, "D")]
+    if not len(candidates):
+        return ()
+    scores = compatibility_scores(birthdate, candidates, as_of)
+    k = min(k, len(candidates))
+
+    # Уникальный ключ: при равных баллах выигрывает более ранняя дата
+    keys = scores * len(candidates) + np.arange(len(candidates) - 1, -1, -1)
+    top = np.argpartition(keys, -k)[-k:]
+    top = top[np.argsort(keys[top])[::-1]]
+    return tuple((candidates[i].item(), int(scores[i])) for i in top)
@@ -0,0 +1,62 @@
+import datetime
+
+from dateutil.parser import parse
+
+from biorithmic_tree import BiorhythmCompatibility, top_compatible_birthdates
+from pythogoras_square import PythagorasSquare, calculate_square_compatibility
+
+
+def calculate_compatibility(birthday1, birthday2):
+    try:
+        biorhythm_result = BiorhythmCompatibility(birthday1, birthday2)
+        biorhythm_str = (biorhythm_result.calculate_compatibility())
+        square_str = calculate_square_compatibility(birthday1, birthday2)
+
+        return (
+            f"🤍Совместимость между {birthday1.strftime('%d.%m.%Y')} и {birthday2.strftime('%d.%m.%Y')} рассчитана 🤍\n"
+            f"\nБиоритмы: {biorhythm_str}%\n"
+            f"Квадрат Пифагора: {square_str}%\n"
+        )
+
+    except Exception as e:
+        return f"Ошибка при расчете совместимости: {e}"        #вывод совместимости
+
+
+def calculate_square(birthday1):
+    try:
+        pythagoras1 = PythagorasSquare(birthday1)
+
+        return (
+            f"🧩Рассчет квадрата Пифагора 🧩\n"
+            f"{pythagoras1}"
+        )
+
+    except Exception as e:
+        return f"Ошибка при расчете квадрата Пифагора: {e}"     # вывод кквадрата пифагора
+
+
+def calculate_top_compatible(birthday1, k=10):
+    try:
+        lines = [
+            f"{i}. {birthday2.strftime('%d.%m.%Y')} - {score}%"
+            for i, (birthday2, score) in enumerate(top_compatible_birthdates(birthday1, k), start=1)
+        ]
+
+        return (
+            f"💫Самые совместимые даты рождения с {birthday1.strftime('%d.%m.%Y')} на сегодня 💫\n\n"
+            + "\n".join(lines)
+        )
+
+    except Exception as e:
+        return f"Ошибка при поиске совместимых дат: {e}"     # вывод топа совместимых дат
+
+
+def validate_date(date_str):
+    try:
+        date = parse(date_str, dayfirst=True)
+        if date > datetime.datetime.now():
+            raise ValueError("Такой даты еще не было.")
+        return date.date()
+
+    except ValueError as e:
+        raise ValueError(f"Invalid date: {e}")
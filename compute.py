@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+INLINE_THRESHOLD = 64
+BATCH_SIZE = 512
+
+
+def warm_up() -> None:
+    """Worker initializer: imports the calculation modules once per worker."""
+    import biorithmic_tree  # noqa: F401
+    import calculations  # noqa: F401
+    import pythogoras_square  # noqa: F401
+
+
+def run_batch(func, batch: list[tuple]) -> list:
+    return [func(*args) for args in batch]
+
+
+@dataclass
+class ComputeStats:
+    inline: int = 0
+    offloaded: int = 0
+    batches: int = 0
+    queue_depth: int = 0
+
+
+class ComputePool:
+    """
+    Runs CPU-bound calculations off the event loop.
+
+    Jobs smaller than ``inline_threshold`` (one pair, one square) run right in
+    the handler, since a round trip to a worker costs more than the work itself.
+    Larger jobs go to a process or thread pool, batched by ``batch_size`` items
+    per submission to amortise pickling and IPC.
+    """
+
+    def __init__(
+        self,
+        kind: str = "process",
+        max_workers: int | None = None,
+        inline_threshold: int = INLINE_THRESHOLD,
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.inline_threshold = inline_threshold
+        self.batch_size = batch_size
+        self.stats = ComputeStats()
+        self._executor: Executor | None = None
+
+    async def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=warm_up)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=warm_up)
+
+        # Поднимаем все воркеры заранее, чтобы первый тяжелый запрос не ждал импортов
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, warm_up) for _ in range(self.max_workers)))
+        logging.info(f"Compute pool started: {self.max_workers} {self.kind} workers")
+
+    async def shutdown(self) -> None:
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        logging.info(f"Compute pool stopped: {self.stats}")
+
+    def get_report(self) -> str:
+        return (
+            f"Вычисления ({self.max_workers} {self.kind}): на месте {self.stats.inline}, "
+            f"в воркерах {self.stats.offloaded} ({self.stats.batches} пачек), очередь {self.stats.queue_depth}"
+        )
+
+    async def run(self, func, *args, size: int = 1):
+        """Runs one job; ``size`` is the number of calculations it stands for."""
+        if self._executor is None or size < self.inline_threshold:
+            self.stats.inline += 1
+            return func(*args)
+        return await self._submit(func, *args)
+
+    async def map(self, func, items: list[tuple]) -> list:
+        """
+        Runs ``func(*args)`` for each item, preserving the order of results.
+
+        Entry point for bulk jobs (multi-person comparisons, date ranges, reports);
+        the bot has no such handler yet, single jobs go through run().
+        """
+        if self._executor is None or len(items) < self.inline_threshold:
+            self.stats.inline += len(items)
+            return run_batch(func, items)
+
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        self.stats.batches += len(batches)
+        results = await asyncio.gather(*(self._submit(run_batch, func, batch, count=len(batch)) for batch in batches))
+        return [result for batch_result in results for result in batch_result]
+
+    async def _submit(self, func, *args, count: int = 1):
+        loop = asyncio.get_running_loop()
+        self.stats.queue_depth += 1
+        self.stats.offloaded += count
+        try:
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.stats.queue_depth -= 1
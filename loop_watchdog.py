@@ -0,0 +1,154 @@
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from dataclasses import dataclass
+
+
+LAG_THRESHOLD = 0.25
+HEARTBEAT_INTERVAL = 0.1
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Окружение Python может лежать внутри проекта (venv/, .venv/), его кадры - не код проекта
+LIBRARY_DIRS = tuple(
+    os.path.join(os.path.abspath(prefix), "")
+    for prefix in {sys.prefix, sys.base_prefix}
+    if not PROJECT_DIR.startswith(os.path.abspath(prefix))
+)
+# Обвязка, через которую проходит любой хендлер; виновника ищем глубже нее
+INFRASTRUCTURE_MODULES = {"compute.py", "loop_watchdog.py", "polling.py", "storage.py"}
+
+
+def is_project_file(path: str) -> bool:
+    if not path.startswith(PROJECT_DIR) or path.startswith(LIBRARY_DIRS):
+        return False
+    parts = path.split(os.sep)
+    return "site-packages" not in parts and "dist-packages" not in parts
+
+
+@dataclass
+class StallStats:
+    count: int = 0
+    total: float = 0.0
+    worst: float = 0.0
+    location: str = ""
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag and finds out who blocks the loop.
+
+    A heartbeat coroutine wakes up every ``interval`` seconds and records how
+    late it was. A side thread samples the heartbeat every ``threshold / 4``
+    seconds and, as soon as it is overdue, grabs the loop thread's stack while
+    the stall is still going on. Stalls longer than ``threshold`` are logged
+    with that stack and aggregated by the handler they happened in.
+    """
+
+    def __init__(self, threshold: float = LAG_THRESHOLD, interval: float = HEARTBEAT_INTERVAL) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.offenders: dict[str, StallStats] = {}
+
+        self._last_beat = time.monotonic()
+        self._captured: tuple[float, tuple[str, str, str]] | None = None
+        self._loop_thread_id: int | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    async def start(self) -> None:
+        if self._heartbeat is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._heartbeat = asyncio.create_task(self._beat_forever())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._heartbeat is None:
+            return
+        self._heartbeat.cancel()
+        self._heartbeat = None
+        self._stop_event.set()
+        await asyncio.to_thread(self._thread.join)
+        logging.info(f"Loop watchdog stopped, max lag {self.max_lag * 1000:.0f} ms")
+
+    async def _beat_forever(self) -> None:
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            previous_beat = self._last_beat
+            self._last_beat = now = time.monotonic()
+            self.last_lag = lag = now - before - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self._record_stall(lag, previous_beat)
+
+    def _watch(self) -> None:
+        # Опрашиваем чаще порога и снимаем стек, как только пульс опоздал на один опрос:
+        # любая остановка длиннее порога тогда гарантированно попадает в снимок
+        sample_period = self.threshold / 4
+        while not self._stop_event.wait(sample_period):
+            beat = self._last_beat
+            if time.monotonic() - beat <= self.interval + sample_period:
+                continue
+            if self._captured is not None and self._captured[0] == beat:
+                continue  # эту остановку уже засняли
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                # Отмечаем снимок последним пульсом, чтобы не приписать его следующей остановке
+                self._captured = (beat, self._describe(frame))
+                del frame
+
+    @staticmethod
+    def _describe(frame) -> tuple[str, str, str]:
+        """Returns the handler name, the innermost project frame and the formatted stack."""
+        stack = "".join(traceback.format_stack(frame))
+        handler = location = None
+        while frame is not None and handler is None:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            if is_project_file(code.co_filename) and filename not in INFRASTRUCTURE_MODULES:
+                if location is None:
+                    location = f"{filename}:{frame.f_lineno} {code.co_name}"
+                if code.co_flags & inspect.CO_COROUTINE:
+                    handler = code.co_name
+            frame = frame.f_back
+        # Цикл может стоять и вне кода хендлеров: в библиотеках, GC, самом aiogram
+        return handler or "<unknown>", location or "", stack
+
+    def _record_stall(self, lag: float, previous_beat: float) -> None:
+        captured, self._captured = self._captured, None
+        if captured is not None and captured[0] == previous_beat:
+            handler, location, stack = captured[1]
+        else:
+            handler, location, stack = "<unknown>", "", ""
+        stats = self.offenders.setdefault(handler, StallStats())
+        stats.count += 1
+        stats.total += lag
+        stats.worst = max(stats.worst, lag)
+        stats.location = location or stats.location
+        logging.warning(f"Event loop blocked for {lag * 1000:.0f} ms in {handler} ({location})\n{stack}")
+
+    def get_report(self, limit: int = 5) -> str:
+        lines = [
+            f"Задержка цикла: сейчас {self.last_lag * 1000:.0f} мс, максимум {self.max_lag * 1000:.0f} мс",
+        ]
+        offenders = sorted(self.offenders.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        if not offenders:
+            lines.append("Блокировок не было")
+        for handler, stats in offenders:
+            lines.append(
+                f"{handler}: {stats.count} раз, всего {stats.total * 1000:.0f} мс, "
+                f"худшая {stats.worst * 1000:.0f} мс ({stats.location})"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from contextlib import suppress
+from dataclasses import dataclass, field
+from aiogram import Bot, Dispatcher
+from aiogram.methods import GetUpdates
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+
+OFFSET_FILE = 'OFFSET.txt'
+UPDATES_LIMIT = 100
+
+
+def load_offset(path: str = OFFSET_FILE) -> tuple[int | None, set[int]]:
+    """
+    Reads the persisted update offset and the ids above it that were already
+    processed; (None, set()) if there is nothing to resume from.
+    """
+    try:
+        with open(path, 'r') as f:
+            offset, *done_ids = f.read().split()
+            return int(offset), {int(update_id) for update_id in done_ids}
+    except (FileNotFoundError, ValueError):
+        return None, set()
+
+
+def save_offset(path: str, offset: int, done_ids: set[int] = frozenset()) -> None:
+    """Writes the offset atomically so a crash never leaves a half-written file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(" ".join(str(update_id) for update_id in [offset, *sorted(done_ids)]))
+    os.replace(tmp_path, path)
+
+
+@dataclass
+class PollingStats:
+    started_at: float = field(default_factory=time.monotonic)
+    ready_at: float | None = None
+    backlog_drained_at: float | None = None
+    backlog_updates: int = 0
+    processed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    duplicates_skipped: int = 0
+    unfinished_on_shutdown: int = 0
+
+    @property
+    def restart_time(self) -> float | None:
+        if self.ready_at is None:
+            return None
+        return self.ready_at - self.started_at
+
+    @property
+    def backlog_throughput(self) -> float | None:
+        if self.backlog_drained_at is None or self.ready_at is None:
+            return None
+        elapsed = self.backlog_drained_at - self.ready_at
+        return self.backlog_updates / elapsed if elapsed > 0 else float(self.backlog_updates)
+
+
+class GracefulPolling:
+    """
+    Long polling that never drops updates across restarts.
+
+    The last processed offset is persisted, so on start the bot resumes where it
+    stopped and works off the backlog at ``catch_up_rate`` updates per second.
+    On SIGTERM/SIGINT fetching stops, in-flight updates get ``drain_timeout``
+    seconds to finish and the offset of the oldest unfinished one is saved,
+    together with the ids above it that already finished, so those are not
+    answered twice. A handler gets at most ``handler_timeout`` seconds, so one
+    hung update cannot hold the offset and stop intake.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        offset_path: str = OFFSET_FILE,
+        polling_timeout: int = 10,
+        drain_timeout: float = 25.0,
+        handler_timeout: float = 30.0,
+        catch_up_rate: float = 30.0,
+        max_in_flight: int = 100,
+    ) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.offset_path = offset_path
+        self.polling_timeout = polling_timeout
+        self.drain_timeout = drain_timeout
+        self.handler_timeout = handler_timeout
+        self.catch_up_rate = catch_up_rate
+        self.stats = PollingStats()
+
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._stop_event = asyncio.Event()
+        self._in_flight: dict[int, asyncio.Task] = {}
+        self._next_update_id: int | None = None
+        self._done_ids: set[int] = set()  # обработанные апдейты выше committed_offset
+        self._saved: tuple[int | None, set[int]] = (None, set())
+
+    def stop(self) -> None:
+        if not self._stop_event.is_set():
+            logging.warning("Stop requested, draining in-flight updates")
+        self._stop_event.set()
+
+    @property
+    def committed_offset(self) -> int | None:
+        # Всё, что меньше самого старого незавершенного апдейта, уже обработано.
+        # Только этот offset уходит в getUpdates: больший Telegram счел бы подтверждением
+        # и забыл бы апдейты, которые еще обрабатываются
+        if self._in_flight:
+            return min(self._in_flight)
+        return self._next_update_id
+
+    def persist_offset(self) -> None:
+        offset = self.committed_offset
+        if offset is None:
+            return
+        self._done_ids = {update_id for update_id in self._done_ids if update_id >= offset}
+        if (offset, self._done_ids) == self._saved:
+            return
+        save_offset(self.offset_path, offset, self._done_ids)
+        self._saved = (offset, set(self._done_ids))
+
+    async def run(self, **kwargs) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:  # Windows
+                pass
+
+        self._next_update_id, self._done_ids = load_offset(self.offset_path)
+        self._saved = (self._next_update_id, set(self._done_ids))
+        workflow_data = {"dispatcher": self.dp, "bots": (self.bot,), **self.dp.workflow_data, **kwargs}
+        await self.dp.emit_startup(bot=self.bot, **workflow_data)
+        logging.info(f"Start polling from offset {self._next_update_id}")
+        try:
+            await self._poll(workflow_data)
+        finally:
+            await self._drain()
+            self.persist_offset()
+            logging.info(
+                f"Polling stopped: processed={self.stats.processed} failed={self.stats.failed} "
+                f"unfinished={self.stats.unfinished_on_shutdown} offset={self._saved[0]}"
+            )
+            try:
+                await self.dp.emit_shutdown(bot=self.bot, **workflow_data)
+            finally:
+                await self.bot.session.close()
+
+    async def _poll(self, workflow_data: dict) -> None:
+        backoff = Backoff(config=BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1))
+        allowed_updates = self.dp.resolve_used_update_types()
+        catching_up = True
+
+        while not self._stop_event.is_set():
+            get_updates = GetUpdates(
+                offset=self.committed_offset,
+                limit=UPDATES_LIMIT,
+                timeout=0 if catching_up else self.polling_timeout,
+                allowed_updates=allowed_updates,
+            )
+            updates = await self._fetch(get_updates)
+            if updates is None:
+                break
+            if updates is False:
+                delay = next(backoff)
+                logging.warning(f"Sleep for {delay:.1f} seconds and try again...")
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop_event.wait(), delay)
+                continue
+            backoff.reset()
+
+            if self.stats.ready_at is None:
+                self.stats.ready_at = time.monotonic()
+                logging.info(f"Polling ready in {self.stats.restart_time:.3f}s")
+
+            # Пока старые апдейты обрабатываются, Telegram присылает их снова, пропускаем
+            new_updates = [
+                update for update in updates
+                if self._next_update_id is None or update.update_id >= self._next_update_id
+            ]
+            for update in new_updates:
+                if self._stop_event.is_set():
+                    break
+                if update.update_id in self._done_ids:
+                    # Обработан до рестарта, но тогда его не дал подтвердить более старый апдейт
+                    self.stats.duplicates_skipped += 1
+                    self._next_update_id = update.update_id + 1
+                    continue
+                if catching_up:
+                    self.stats.backlog_updates += 1
+                    await asyncio.sleep(1 / self.catch_up_rate)
+                await self._semaphore.acquire()
+                self._dispatch(update, workflow_data)
+                self._next_update_id = update.update_id + 1
+
+            self.persist_offset()
+
+            if updates and not new_updates:
+                # Сервер отвечает сразу, пока не подтверждены незавершенные апдейты,
+                # поэтому ждем, пока хоть один из них закончится, а не опрашиваем вхолостую
+                await self._wait_in_flight()
+
+            # Неполная пачка значит, что очередь на сервере разобрана
+            if catching_up and len(updates) < UPDATES_LIMIT:
+                catching_up = False
+                self.stats.backlog_drained_at = time.monotonic()
+                logging.info(
+                    f"Backlog of {self.stats.backlog_updates} updates caught up "
+                    f"at {self.stats.backlog_throughput:.1f} updates/s"
+                )
+
+    async def _fetch(self, get_updates: GetUpdates):
+        """Returns updates, False on a request error and None if stop was requested meanwhile."""
+        fetch = asyncio.create_task(self.bot(get_updates))
+        stop = asyncio.create_task(self._stop_event.wait())
+        await asyncio.wait({fetch, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if not fetch.done():
+            fetch.cancel()
+            return None
+        try:
+            return fetch.result()
+        except asyncio.CancelledError:
+            return None
+        except Exception as e:
+            logging.error(f"Failed to fetch updates - {type(e).__name__}: {e}")
+            return False
+
+    async def _wait_in_flight(self) -> None:
+        if not self._in_flight:
+            return
+        stop = asyncio.create_task(self._stop_event.wait())
+        await asyncio.wait(
+            {stop, *self._in_flight.values()},
+            timeout=self.polling_timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        stop.cancel()
+
+    def _dispatch(self, update, workflow_data: dict) -> None:
+        task = asyncio.create_task(self._process(update, workflow_data))
+        self._in_flight[update.update_id] = task
+
+    async def _process(self, update, workflow_data: dict) -> None:
+        try:
+            await asyncio.wait_for(self.dp.feed_update(self.bot, update, **workflow_data), self.handler_timeout)
+            self.stats.processed += 1
+            self._done_ids.add(update.update_id)
+        except asyncio.TimeoutError:
+            # Зависший апдейт считаем обработанным, иначе он держит offset и снова придет после рестарта
+            self.stats.timed_out += 1
+            self._done_ids.add(update.update_id)
+            logging.error(f"Update {update.update_id} was not processed in {self.handler_timeout}s, skipping it")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._done_ids.add(update.update_id)
+            self.stats.failed += 1
+            logging.exception(f"An error occurred while processing update {update.update_id}: {e}")
+        finally:
+            self._in_flight.pop(update.update_id, None)
+            self._semaphore.release()
+
+    async def _drain(self) -> None:
+        if not self._in_flight:
+            return
+        started = time.monotonic()
+        tasks = list(self._in_flight.values())
+        logging.info(f"Draining {len(tasks)} in-flight updates (deadline {self.drain_timeout}s)")
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        if pending:
+            # Незавершенные апдейты остаются в offset и придут повторно после рестарта
+            offset = self.committed_offset
+            self.stats.unfinished_on_shutdown = len(pending)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self._in_flight.clear()
+            self._next_update_id = offset
+        logging.info(f"Drained in {time.monotonic() - started:.3f}s, {len(pending)} left unfinished")
@@ -1,6 +1,25 @@
 import dataclasses
 import datetime
 
+import numpy as np
+
+
+SECTOR_TITLES = (
+    "Характер", "Энергия", "Интерес", "Здоровье", "Логика", "Труд", "Удача", "Долг", "Память",
+    "Самооценка", "Быт", "Талант", "Цель", "Семья", "Привычки", "Дух", "Темперамент",
+)
+
+# Цифры, из которых складываются производные линии (Самооценка ... Темперамент)
+DERIVED_SECTOR_DIGITS = (
+    (1, 2, 3), (4, 5, 6), (7, 8, 9), (1, 4, 7), (2, 5, 8), (3, 6, 9), (1, 5, 9), (3, 5, 7),
+)
+
+# Строка i - цифра i + 1, столбец - сектор в порядке SECTOR_TITLES
+SECTOR_MATRIX = np.zeros((9, len(SECTOR_TITLES)), dtype=np.uint8)
+SECTOR_MATRIX[:, :9] = np.eye(9, dtype=np.uint8)
+for column, digits in enumerate(DERIVED_SECTOR_DIGITS, start=9):
+    SECTOR_MATRIX[[digit - 1 for digit in digits], column] = 1
+
 
 @dataclasses.dataclass
 class Sector:
@@ -222,3 +241,80 @@ class PythagorasSquare:
             f"Дух - {self.get_printable_sector_value(self.spirit)}\n"
             f"Темперамент - {self.get_printable_sector_value(self.temperament)}\n"
         ) # calc pyth square
+
+    def get_vector(self) -> np.ndarray:
+        return np.array(
+            [
+                self.character.value, self.energy.value, self.interest.value,
+                self.health.value, self.logic.value, self.labour.value,
+                self.luck.value, self.duty.value, self.memory.value,
+                self.self_assessment.value, self.life.value, self.talent.value,
+                self.goal.value, self.family.value, self.habits.value,
+                self.spirit.value, self.temperament.value,
+            ],
+            dtype=np.uint8,
+        )
+
+
+def split_digits(number: np.ndarray) -> list[np.ndarray]:
+    """Both digits of a two-digit number, the same way zero_fill() pads it."""
+    return [number // 10, number % 10]
+
+
+def get_sector_vectors(birthdates) -> np.ndarray:
+    """
+    Computes the 17 sector values for many birthdates at once.
+
+    Returns an (N, 17) uint8 array in SECTOR_TITLES order, row for row equal
+    to PythagorasSquare(birthdate).get_vector() but without building Sectors.
+    """
+    dates = np.asarray(birthdates, dtype="datetime64[D]").reshape(-1)
+    months_since_epoch = dates.astype("datetime64[M]")
+    days = (dates - months_since_epoch).astype(np.int64) + 1
+    months = months_since_epoch.astype(np.int64) % 12 + 1
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+
+    first_row = (
+        split_digits(days)
+        + split_digits(months)
+        + split_digits(years // 100)
+        + split_digits(years % 100)
+    )
+    first = sum(first_row)
+    second = first // 10 + first % 10
+    third = first - first_row[0] * 2
+    fourth = third // 10 + third % 10
+    digits = np.stack(
+        first_row
+        + split_digits(first)
+        + split_digits(second)
+        + split_digits(third)
+        + split_digits(fourth),
+        axis=1,
+    )
+
+    counts = np.stack([(digits == digit).sum(axis=1) for digit in range(1, 10)], axis=1)
+    return (counts @ SECTOR_MATRIX).astype(np.uint8)
+
+
+def get_sector_vector(birthdate: datetime.date) -> np.ndarray:
+    return get_sector_vectors([birthdate])[0]
+
+
+def square_compatibility_batch(first_vectors: np.ndarray, second_vectors: np.ndarray) -> np.ndarray:
+    """
+    Scores pairs of sector vectors from 0 to 100.
+
+    The score is 100 minus the share of the pair's total sector weight that
+    differs between the two people, so identical squares give 100.
+    """
+    first_vectors = np.asarray(first_vectors, dtype=np.int32)
+    second_vectors = np.asarray(second_vectors, dtype=np.int32)
+    difference = np.abs(first_vectors - second_vectors).sum(axis=-1)
+    total = (first_vectors + second_vectors).sum(axis=-1)
+    return 100 - (100 * difference) // np.maximum(total, 1)
+
+
+def calculate_square_compatibility(first_birthdate: datetime.date, second_birthdate: datetime.date) -> int:
+    vectors = get_sector_vectors([first_birthdate, second_birthdate])
+    return int(square_compatibility_batch(vectors[0], vectors[1]))
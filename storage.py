@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import sys
+import time
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+STATE_TTL = 3600.0
+MAX_ENTRIES = 100_000
+WHEEL_SLOTS = 512
+WHEEL_RESOLUTION = 1.0
+
+
+class TTLRecord:
+    __slots__ = ("state", "data", "expires_at", "tick", "size")
+
+    def __init__(self) -> None:
+        self.state: str | None = None
+        self.data: dict[str, Any] | None = None  # None вместо пустого словаря
+        self.expires_at = 0.0
+        self.tick = 0
+        self.size = 0
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+    def get_size(self, key: StorageKey) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(key)
+        if self.data:
+            size += sys.getsizeof(self.data)
+            for name, value in self.data.items():
+                size += sys.getsizeof(name) + sys.getsizeof(value)
+        return size
+
+
+@dataclass
+class StorageStats:
+    live_entries: int
+    evictions: int
+    expirations: int
+    bytes_used: int
+
+
+class TTLMemoryStorage(BaseStorage):
+    """
+    In-memory FSM storage with a bounded footprint.
+
+    Every record lives ``ttl`` seconds after its last access, and at most
+    ``max_entries`` records are kept, the least recently used one is evicted
+    first. Records are dropped as soon as the state is cleared, and expired
+    ones are found by a timer wheel: each tick the sweeper only looks at the
+    keys due in that slot instead of scanning the whole storage.
+    """
+
+    def __init__(
+        self,
+        ttl: float = STATE_TTL,
+        max_entries: int = MAX_ENTRIES,
+        wheel_slots: int = WHEEL_SLOTS,
+        resolution: float = WHEEL_RESOLUTION,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.resolution = resolution
+        self.storage: OrderedDict[StorageKey, TTLRecord] = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+        self.bytes_used = 0
+
+        self._wheel: list[set[StorageKey]] = [set() for _ in range(wheel_slots)]
+        self._swept_tick = self._get_tick(time.monotonic()) - 1
+        self._sweeper: asyncio.Task | None = None
+
+    @property
+    def stats(self) -> StorageStats:
+        return StorageStats(
+            live_entries=len(self.storage),
+            evictions=self.evictions,
+            expirations=self.expirations,
+            bytes_used=self.bytes_used,
+        )
+
+    def get_report(self) -> str:
+        stats = self.stats
+        return (
+            f"FSM: записей {stats.live_entries}, вытеснено {stats.evictions}, "
+            f"истекло {stats.expirations}, занято {stats.bytes_used / 1024:.1f} КБ"
+        )
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        logging.info(f"FSM storage closed: {self.stats}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        record = self._get_record(key, create=state is not None)
+        if record is None:
+            return
+        # Состояний всего несколько, так что все записи делят одни и те же строки
+        record.state = sys.intern(state) if state is not None else None
+        self._update(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = self._get_record(key)
+        return record.state if record is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = self._get_record(key, create=bool(data))
+        if record is None:
+            return
+        record.data = data.copy() if data else None
+        self._update(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = self._get_record(key)
+        if record is None or record.data is None:
+            return {}
+        return record.data.copy()
+
+    def _get_tick(self, moment: float) -> int:
+        return int(moment / self.resolution)
+
+    def _get_record(self, key: StorageKey, create: bool = False) -> TTLRecord | None:
+        now = time.monotonic()
+        record = self.storage.get(key)
+        if record is not None and record.expires_at <= now:
+            self._remove(key)
+            self.expirations += 1
+            record = None
+
+        if record is None:
+            if not create:
+                return None
+            record = TTLRecord()
+            self.storage[key] = record
+            self._ensure_sweeper()
+            while len(self.storage) > self.max_entries:
+                self._remove(next(iter(self.storage)))
+                self.evictions += 1
+        else:
+            self.storage.move_to_end(key)
+            self._wheel[record.tick % len(self._wheel)].discard(key)
+
+        record.expires_at = now + self.ttl
+        record.tick = self._get_tick(record.expires_at)
+        self._wheel[record.tick % len(self._wheel)].add(key)
+        return record
+
+    def _update(self, key: StorageKey, record: TTLRecord) -> None:
+        if record.is_empty():
+            self._remove(key)
+            return
+        size = record.get_size(key)
+        self.bytes_used += size - record.size
+        record.size = size
+
+    def _remove(self, key: StorageKey) -> None:
+        record = self.storage.pop(key)
+        self._wheel[record.tick % len(self._wheel)].discard(key)
+        self.bytes_used -= record.size
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.resolution)
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Drops records whose slots came due since the last sweep, returns how many."""
+        last_tick = self._get_tick(time.monotonic()) - 1
+        # Больше одного оборота колеса обходить незачем, все слоты уже будут просмотрены
+        first_tick = max(self._swept_tick + 1, last_tick - len(self._wheel) + 1)
+        expired = 0
+        for tick in range(first_tick, last_tick + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            # В слоте могут лежать и ключи следующих оборотов колеса, их не трогаем
+            for key in [key for key in slot if self.storage[key].tick <= tick]:
+                self._remove(key)
+                expired += 1
+        self._swept_tick = max(self._swept_tick, last_tick)
+        self.expirations += expired
+        return expired
@@ -1,293 +1,24 @@
 import logging
-import datetime
-import dataclasses
 
 from email.message import Message
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram import Router
 from aiogram.filters import CommandStart, StateFilter
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 import asyncio
 import random
 
-from dataclasses import dataclass
-from dateutil.parser import parse
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
-
-PHYSICAL_CONST = 23.6884
-EMOTIONAL_CONST = 28.426125
-INTELLIGENT_CONST = 33.163812
-HEART_CONST = 37.901499
-CREATIVE_CONST = 42.6392
-INTUITIVE_CONST = 47.3769
-HIGHER_CONST = 52.1146
-
-
-@dataclass
-class BiorhythmCompatibility:
-    first_birthdate: datetime.date
-    second_birthdate: datetime.date
-
-    def calculate_biorhythm(self, birthdate, period):
-        days_since_birth = (datetime.date.today() - birthdate).days
-        return days_since_birth % period
-
-    def __post_init__(self) -> None:
-        self.first_physical = self.calculate_biorhythm(self.first_birthdate, PHYSICAL_CONST)
-        self.first_emotional = self.calculate_biorhythm(self.first_birthdate, EMOTIONAL_CONST)
-        self.first_intelligent = self.calculate_biorhythm(self.first_birthdate, INTELLIGENT_CONST)
-        self.first_heart = self.calculate_biorhythm(self.first_birthdate, HEART_CONST)
-        self.first_creative = self.calculate_biorhythm(self.first_birthdate, CREATIVE_CONST)
-        self.first_intuitive = self.calculate_biorhythm(self.first_birthdate, INTUITIVE_CONST)
-        self.first_higher = self.calculate_biorhythm(self.first_birthdate, HIGHER_CONST)
-
-
-        self.second_physical = self.calculate_biorhythm(self.second_birthdate, PHYSICAL_CONST)
-        self.second_emotional = self.calculate_biorhythm(self.second_birthdate, EMOTIONAL_CONST)
-        self.second_intelligent = self.calculate_biorhythm(self.second_birthdate, INTELLIGENT_CONST)
-        self.second_heart = self.calculate_biorhythm(self.second_birthdate, HEART_CONST)
-        self.second_creative = self.calculate_biorhythm(self.second_birthdate, CREATIVE_CONST)
-        self.second_intuitive = self.calculate_biorhythm(self.second_birthdate, INTUITIVE_CONST)
-        self.second_higher = self.calculate_biorhythm(self.second_birthdate, HIGHER_CONST)
-
-
-        self.compatibility_percentage = self.calculate_compatibility()
-
-    def calculate_compatibility(self) -> int:
-
-        total_difference = (
-            abs(self.first_physical - self.second_physical) +
-            abs(self.first_emotional - self.second_emotional) +
-            abs(self.first_intelligent - self.second_intelligent) +
-            abs(self.first_heart - self.second_heart) +
-            abs(self.first_creative - self.second_creative) +
-            abs(self.first_intuitive - self.second_intuitive) +
-            abs(self.first_higher - self.second_higher)
-        )
-
-        max_possible_difference = 7 * max(PHYSICAL_CONST, EMOTIONAL_CONST, INTELLIGENT_CONST, HEART_CONST, CREATIVE_CONST, INTUITIVE_CONST, HIGHER_CONST)
-        compatibility = 100 - int((total_difference / max_possible_difference) * 100)
-        return max(0, min(100, compatibility))       #рассчет совместимости по биоритмическому дереву
-
-
-@dataclasses.dataclass
-class Sector:
-    digit: int | None
-    title: str
-    value: int
-
-
-def get_digit_sum(number: int) -> int:
-    return sum(int(digit) for digit in str(number))
-
-
-def zero_fill(number: int, width: int = 2) -> str:
-    return str(number).zfill(width)
-
-
-@dataclasses.dataclass
-class PythagorasSquare:
-    birthdate: datetime.date
-
-    def __post_init__(self) -> None:
-        self.string_birthdate = self.birthdate.strftime("%d%m%Y")
-        self.digit_rows = self.get_digit_rows()
-        self.character = Sector(
-            digit=1,
-            title="Характер",
-            value=self.get_sector_value(1),
-        )
-        self.energy = Sector(
-            digit=2,
-            title="Энергия",
-            value=self.get_sector_value(2),
-        )
-        self.interest = Sector(
-            digit=3,
-            title="Интерес",
-            value=self.get_sector_value(3),
-        )
-        self.health = Sector(
-            digit=4,
-            title="Здоровье",
-            value=self.get_sector_value(4),
-        )
-        self.logic = Sector(
-            digit=5,
-            title="Логика",
-            value=self.get_sector_value(5),
-        )
-        self.labour = Sector(
-            digit=6,
-            title="Труд",
-            value=self.get_sector_value(6),
-        )
-        self.luck = Sector(
-            digit=7,
-            title="Удача",
-            value=self.get_sector_value(7),
-        )
-        self.duty = Sector(
-            digit=8,
-            title="Долг",
-            value=self.get_sector_value(8),
-        )
-        self.memory = Sector(
-            digit=9,
-            title="Память",
-            value=self.get_sector_value(9),
-        )
-
-        self.self_assessment = Sector(
-            digit=None,
-            title="Самооценка",
-            value=self.get_additional_sector_value(
-                [self.character, self.energy, self.interest],
-            ),
-        )
-        self.life = Sector(
-            digit=None,
-            title="Быт",
-            value=self.get_additional_sector_value(
-                [self.health, self.logic, self.labour],
-            ),
-        )
-        self.talent = Sector(
-            digit=None,
-            title="Талант",
-            value=self.get_additional_sector_value([self.luck, self.duty, self.memory]),
-        )
-        self.goal = Sector(
-            digit=None,
-            title="Цель",
-            value=self.get_additional_sector_value(
-                [self.character, self.health, self.luck],
-            ),
-        )
-        self.family = Sector(
-            digit=None,
-            title="Семья",
-            value=self.get_additional_sector_value(
-                [self.energy, self.logic, self.duty],
-            ),
-        )
-        self.habits = Sector(
-            digit=None,
-            title="Привычки",
-            value=self.get_additional_sector_value(
-                [self.interest, self.labour, self.memory],
-            ),
-        )
-        self.spirit = Sector(
-            digit=None,
-            title="Дух",
-            value=self.get_additional_sector_value(
-                [self.character, self.logic, self.memory],
-            ),
-        )
-        self.temperament = Sector(
-            digit=None,
-            title="Темперамент",
-            value=self.get_additional_sector_value(
-                [self.interest, self.logic, self.luck],
-            ),
-        )
-
-    def get_first_number(self) -> int:
-        return get_digit_sum(int(self.string_birthdate))
-
-    def get_second_number(self) -> int:
-        return get_digit_sum(self.get_first_number())
-
-    def get_third_number(self) -> int:
-        return self.get_first_number() - int(self.string_birthdate[0]) * 2
-
-    def get_fourth_number(self) -> int:
-        return get_digit_sum(self.get_third_number())
-
-    def get_digit_rows(self) -> list[list[int]]:
-        second_row = (
-                list(zero_fill(self.get_first_number()))
-                + list(zero_fill(self.get_second_number()))
-                + list(zero_fill(self.get_third_number()))
-                + list(zero_fill(self.get_fourth_number()))
-        )
-
-        return [
-            [int(digit) for digit in self.string_birthdate],
-            [int(digit) for digit in second_row],
-        ]
-
-    def get_sector_value(self, digit: int) -> int:
-        value: int = 0
-        numbers = self.digit_rows[0] + self.digit_rows[1]
-        for d in numbers:
-            if d == digit:
-                value += 1
-        return value
-
-    @staticmethod
-    def get_additional_sector_value(base_sectors: list[Sector]) -> int:
-        value: int = 0
-        for base_sector in base_sectors:
-            value += base_sector.value
-        return value
-
-    def get_magic_square_printable(self) -> list[list[str]]:
-        return [
-            [
-                self.get_printable_sector_value(self.character),
-                self.get_printable_sector_value(self.health),
-                self.get_printable_sector_value(self.luck),
-            ],
-            [
-                self.get_printable_sector_value(self.energy),
-                self.get_printable_sector_value(self.logic),
-                self.get_printable_sector_value(self.duty),
-            ],
-            [
-                self.get_printable_sector_value(self.interest),
-                self.get_printable_sector_value(self.labour),
-                self.get_printable_sector_value(self.memory),
-            ],
-        ]
-
-    @staticmethod
-    def get_printable_sector_value(sector: Sector) -> str:
-        if sector.value == 0:
-            return "нет цифр"
-        if sector.digit is not None:
-            return str(sector.digit) * sector.value
-        else:
-            return str(sector.value)
-
-
-    def __repr__(self) -> str:
-        return (
-            f"Квадрат Пифагора для {self.birthdate.strftime('%d.%m.%Y')}:\n\n"
-            f"Характер - {self.get_printable_sector_value(self.character)}\n"
-            f"Энергия - {self.get_printable_sector_value(self.energy)}\n"
-            f"Интерес - {self.get_printable_sector_value(self.interest)}\n"
-            f"Здоровье - {self.get_printable_sector_value(self.health)}\n"
-            f"Логика - {self.get_printable_sector_value(self.logic)}\n"
-            f"Труд - {self.get_printable_sector_value(self.labour)}\n"
-            f"Удача - {self.get_printable_sector_value(self.luck)}\n"
-            f"Долг - {self.get_printable_sector_value(self.duty)}\n"
-            f"Память - {self.get_printable_sector_value(self.memory)}\n"
-            f"Самооценка - {self.get_printable_sector_value(self.self_assessment)}\n"
-            f"Быт - {self.get_printable_sector_value(self.life)}\n"
-            f"Талант - {self.get_printable_sector_value(self.talent)}\n"
-            f"Цель - {self.get_printable_sector_value(self.goal)}\n"
-            f"Семья - {self.get_printable_sector_value(self.family)}\n"
-            f"Привычки - {self.get_printable_sector_value(self.habits)}\n"
-            f"Дух - {self.get_printable_sector_value(self.spirit)}\n"
-            f"Темперамент - {self.get_printable_sector_value(self.temperament)}\n"
-        )  #рассчет квадрата пифагора
+from biorithmic_tree import SEARCH_END, SEARCH_START
+from calculations import calculate_compatibility, calculate_square, calculate_top_compatible, validate_date
+from compute import ComputePool
+from loop_watchdog import LoopWatchdog
+from polling import GracefulPolling
+from storage import TTLMemoryStorage
 
 
 class Form(StatesGroup):
@@ -300,10 +31,29 @@ class Form(StatesGroup):
 with open('TOKEN.txt', 'r') as f:
     token = f.read().strip()
 
+# id администраторов через пробел или с новой строки, им доступны отладочные команды
+try:
+    with open('ADMIN_ID.txt', 'r') as f:
+        admin_ids = {int(admin_id) for admin_id in f.read().split()}
+except FileNotFoundError:
+    admin_ids = set()
+
 start_router = Router()
 bot = Bot(token)
-dp = Dispatcher(bot=bot, storage=MemoryStorage())
+storage = TTLMemoryStorage()
+dp = Dispatcher(bot=bot, storage=storage)
 dp.include_router(start_router)
+# Тяжелых задач пока мало (только /top), поэтому хватает пары потоков: процессы грузят
+# каждый свой numpy и делят кэш /top между собой. Для массовых расчетов - "process"
+COMPUTE_POOL_KIND = "thread"
+COMPUTE_WORKERS = 2
+compute = ComputePool(kind=COMPUTE_POOL_KIND, max_workers=COMPUTE_WORKERS)
+TOP_SEARCH_SIZE = (SEARCH_END - SEARCH_START).days + 1  # столько дат перебирает /top
+dp.startup.register(compute.start)
+dp.shutdown.register(compute.shutdown)
+watchdog = LoopWatchdog()
+dp.startup.register(watchdog.start)
+dp.shutdown.register(watchdog.stop)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -334,7 +84,27 @@ async def cmd_start(message: types.Message):
 @dp.message(Command('help'))
 async def cmd_help(message: types.Message):
     await message.answer(
-        "Я могу поделиться предсказанием и рассчитать совместимость. Выберите 'Получить предсказание' или 'Совместимость'")
+        "Я могу поделиться предсказанием и рассчитать совместимость. Выберите 'Получить предсказание' или 'Совместимость'\n"
+        "Команда /top ДД.ММ.ГГГГ покажет самые совместимые с вами даты рождения на сегодня")
+
+
+@dp.message(Command('top'))
+async def cmd_top(message: types.Message, command: CommandObject):
+    try:
+        birthdate = validate_date(command.args or "")
+        result = await compute.run(calculate_top_compatible, birthdate, size=TOP_SEARCH_SIZE)
+        await message.answer(result)
+
+    except (ValueError, IndexError, OverflowError):
+        await message.answer("Укажите дату рождения после команды: /top ДД.ММ.ГГГГ")
+
+    except Exception as e:
+        logging.exception(f"An error occurred: {e}")
+
+
+@dp.message(Command('lag'), F.from_user.id.in_(admin_ids))
+async def cmd_lag(message: types.Message):
+    await message.answer(f"{watchdog.get_report()}\n\n{compute.get_report()}\n{storage.get_report()}")
 
 
 @dp.message()
@@ -410,49 +180,11 @@ predictions = [
 
 
 
-def calculate_compatibility(birthday1, birthday2):
-    try:
-        biorhythm_result = BiorhythmCompatibility(birthday1, birthday2)
-        biorhythm_str = (biorhythm_result.calculate_compatibility())
-
-        return (
-            f"🤍Совместимость между {birthday1.strftime('%d.%m.%Y')} и {birthday2.strftime('%d.%m.%Y')} рассчитана 🤍\n"
-            f"\nБиоритмы: {biorhythm_str}%\n"
-        )
-
-    except Exception as e:
-        return f"Ошибка при расчете совместимости: {e}"        #вывод совместимости
-
-
-def calculate_square(birthday1):
-    try:
-        pythagoras1 = PythagorasSquare(birthday1)
-
-        return (
-            f"🧩Рассчет квадрата Пифагора 🧩\n"
-            f"{pythagoras1}"
-        )
-
-    except Exception as e:
-        return f"Ошибка при расчете квадрата Пифагора: {e}"     # вывод кквадрата пифагора
-
-
-def validate_date(date_str):
-    try:
-        date = parse(date_str, dayfirst=True)
-        if date > datetime.datetime.now():
-            raise ValueError("Такой даты еще не было.")
-        return date.date()
-
-    except ValueError as e:
-        raise ValueError(f"Invalid date: {e}")
-
-
 @dp.message(StateFilter(Form.waiting_for_birthdate2))
 async def pyth_birthdate(message: types.Message, state: FSMContext):
     try:
         birthdate = validate_date(message.text)
-        result = calculate_square(birthdate)
+        result = await compute.run(calculate_square, birthdate)
         await message.answer(result)
         await state.clear()
 
@@ -498,7 +230,7 @@ async def process_second_birthdate(message: types.Message, state: FSMContext):
         birthday2 = validate_date(message.text)
         user_data = await state.get_data()
         birthday1 = user_data['birthday1']
-        compatibility_result = calculate_compatibility(birthday1, birthday2)
+        compatibility_result = await compute.run(calculate_compatibility, birthday1, birthday2)
         await message.answer(compatibility_result)
         await message.answer("Для получения более развернутой совместимости нажмите кнопку 'Оплатить'.",
                              reply_markup=payment_keyboard())
@@ -527,7 +259,7 @@ async def handle_payment(callback_query: types.CallbackQuery):
 
 
 async def main():
-    await dp.start_polling(bot, skip_updates=True)
+    await GracefulPolling(dp, bot).run()
 
 
 if __name__ == "__main__":